@@ -0,0 +1,117 @@
+# 電卓のマイクロベンチマーク（実機不要）。fake M5 を挿して本物の main の処理時間を測る。
+# 実行: python bench_calc.py
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+
+class _Any:
+    """どんな属性アクセス/呼び出しも飲み込むダミー（M5.Lcd.* などの描画を無効化）"""
+
+    def __getattr__(self, _):
+        return _Any()
+
+    def __call__(self, *a, **k):
+        return 0
+
+
+sys.modules["M5"] = _Any()
+
+import main  # noqa: E402
+
+
+def bench(name, func, n):
+    """func を n 回実行し、1回あたりの時間（マイクロ秒）を表示する"""
+    func()  # ウォームアップ（キャッシュを温める）
+    start = time.perf_counter()
+    for _ in range(n):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<32} {elapsed / n * 1e6:10.2f} us")
+
+
+# レイアウトのコンパイル（起動時に一度だけ行う処理）
+for layout_name, spec in main.LAYOUT_SPECS.items():
+    bench(f"compile_layout({layout_name})", lambda spec=spec: main.compile_layout(spec), 2000)
+bench("compile_layouts()", main.compile_layouts, 1000)
+
+# コンパイル済みテーブルでの当たり判定（最悪ケース = 最後のキー）
+main.set_layout("scientific")
+bench("hit_test(last key)", lambda: main.hit_test(400, 830), 100000)
+
+
+# キー処理: 対応表化する前（baseline コミット）の button_pressed と、今の button_pressed の比較。
+# どちらも本物の実装を使い、表示更新（update_display）だけ外して測る。
+BASELINE_COMMIT = "b4a3c1c"
+KEYS = ("1", "2", ".", "5", "*", "3", "=", "+/-", "-", "9", "<", "/", "4", "=", "rt", "C")
+REPEATS = 7
+
+
+def load_baseline():
+    """baseline コミットの main.py を別モジュールとして読み込む"""
+    source = subprocess.run(
+        ["git", "show", f"{BASELINE_COMMIT}:main.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    module = types.ModuleType("main_baseline")
+    exec(compile(source, "main_baseline.py", "exec"), module.__dict__)
+    return module
+
+
+def best_of(func, n):
+    """func を n 回実行する計測を REPEATS 回繰り返し、最速の1回あたり時間（秒）を返す"""
+    func()  # ウォームアップ
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(n):
+            func()
+        elapsed = (time.perf_counter() - start) / n
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_keys(module):
+    press = module.button_pressed
+    for key in KEYS:
+        press(key)
+
+
+baseline = load_baseline()
+for name, module in (("baseline if/elif chain", baseline), ("dispatch table", main)):
+    module.update_display = lambda: None
+    elapsed = best_of(lambda module=module: run_keys(module), 20000)
+    print(f"{len(KEYS)} keys: {name:<22} {elapsed * 1e6:10.2f} us (best of {REPEATS})")
+
+
+# 振り分け経路のメモリ確保（空ループとの差。表示文字列や計算結果を作らないキーで測る）
+def traced(func, n=1000):
+    """func を n 回実行したときの tracemalloc の (現在量, ピーク) を返す"""
+    func()
+    tracemalloc.start()
+    for _ in range(n):
+        func()
+    usage = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return usage
+
+
+def press_operator_after_clear():
+    main.clear_on_next_input = True
+    main.key_handlers.get("+")("+")
+
+
+empty = traced(lambda: None)
+for name, func in (
+    ('key_handlers.get("C")("C")', lambda: main.key_handlers.get("C")("C")),
+    ('key_handlers.get("+")("+")', press_operator_after_clear),
+):
+    current, peak = traced(func)
+    print(f"alloc: {name:<28} {current - empty[0]:+6d} B now, {peak - empty[1]:+6d} B peak")
@@ -0,0 +1,126 @@
+# telemetry.py が書いたバイナリログを PC 上で集計する（実機不要）
+# 実行: python decode_log.py telemetry.bin.old telemetry.bin
+# ログの取り出し例: python -m mpremote fs cp :telemetry.bin .
+import struct
+import sys
+
+import telemetry
+
+# キー処理時間のヒストグラムの区切り（ms）
+LATENCY_BUCKETS = (10, 20, 50, 100, 200, 500, 1000)
+
+
+def read_records(stream):
+    """ストリームからレコードを (時刻, 種別, コード, 値) で順に返す（ブロック単位で読む）"""
+    unpack_from = struct.Struct(telemetry.RECORD).unpack_from
+    while True:
+        chunk = stream.read(telemetry.BLOCK_SIZE)
+        if not chunk:
+            return
+        # 書き込み途中で電源が落ちた末尾の半端なレコードは捨てる
+        usable = len(chunk) - len(chunk) % telemetry.RECORD_SIZE
+        for offset in range(0, usable, telemetry.RECORD_SIZE):
+            yield unpack_from(chunk, offset)
+
+
+def summarize(records):
+    """レコード列を集計する"""
+    stats = {
+        "records": 0,
+        "boots": 0,
+        "keys": {},
+        "latency": {"count": 0, "total": 0, "max": 0, "histogram": [0] * (len(LATENCY_BUCKETS) + 1)},
+        "errors": {},
+        "heap_kb": {"min": None, "last": None},
+        "battery": {"first": None, "last": None, "min": None},
+        "dropped": 0,
+        "unknown_events": 0,
+    }
+    latency = stats["latency"]
+    heap = stats["heap_kb"]
+    battery = stats["battery"]
+
+    for _, event, code, value in records:
+        if event == telemetry.PAD:
+            continue
+        stats["records"] += 1
+
+        if event == telemetry.BOOT:
+            stats["boots"] += 1
+        elif event == telemetry.KEY:
+            key = telemetry.KEYS[code] if code < len(telemetry.KEYS) else "?"
+            stats["keys"][key] = stats["keys"].get(key, 0) + 1
+        elif event == telemetry.LATENCY:
+            latency["count"] += 1
+            latency["total"] += value
+            latency["max"] = max(latency["max"], value)
+            bucket = 0
+            while bucket < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[bucket]:
+                bucket += 1
+            latency["histogram"][bucket] += 1
+        elif event == telemetry.ERROR:
+            name = telemetry.ERROR_TYPES[code] if code < len(telemetry.ERROR_TYPES) else "?"
+            stats["errors"][name] = stats["errors"].get(name, 0) + 1
+        elif event == telemetry.HEAP:
+            heap["min"] = value if heap["min"] is None else min(heap["min"], value)
+            heap["last"] = value
+        elif event == telemetry.BATTERY:
+            if battery["first"] is None:
+                battery["first"] = value
+            battery["min"] = value if battery["min"] is None else min(battery["min"], value)
+            battery["last"] = value
+        elif event == telemetry.DROPPED:
+            stats["dropped"] += value
+        else:
+            stats["unknown_events"] += 1
+
+    return stats
+
+
+def print_summary(stats):
+    """集計結果を表示する"""
+    latency = stats["latency"]
+    print(f"Records: {stats['records']}  Boots: {stats['boots']}")
+
+    print(f"Key presses: {sum(stats['keys'].values())}")
+    for key, count in sorted(stats["keys"].items(), key=lambda item: -item[1]):
+        print(f"  {key:>4}: {count}")
+
+    if latency["count"]:
+        print(f"Latency: avg {latency['total'] / latency['count']:.1f} ms, max {latency['max']} ms")
+        lower = 0
+        for bound, count in zip(LATENCY_BUCKETS + (None,), latency["histogram"]):
+            label = f"{lower}-{bound} ms" if bound is not None else f">{lower} ms"
+            print(f"  {label:>12}: {count}")
+            lower = bound
+
+    print(f"Errors: {sum(stats['errors'].values())}")
+    for name, count in sorted(stats["errors"].items(), key=lambda item: -item[1]):
+        print(f"  {name}: {count}")
+
+    heap = stats["heap_kb"]
+    if heap["last"] is not None:
+        print(f"Heap free: min {heap['min']} KB, last {heap['last']} KB")
+    battery = stats["battery"]
+    if battery["last"] is not None:
+        print(f"Battery: {battery['first']}% -> {battery['last']}% (min {battery['min']}%)")
+    if stats["dropped"]:
+        print(f"Dropped (buffer overflow): {stats['dropped']} records")
+    if stats["unknown_events"]:
+        print(f"Unknown events: {stats['unknown_events']}")
+
+
+def main(paths):
+    def records():
+        for path in paths:
+            with open(path, "rb") as stream:
+                yield from read_records(stream)
+
+    print_summary(summarize(records()))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python decode_log.py LOG [LOG ...]")
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -5,7 +5,7 @@ echo ========================================
 echo  M5PaperS3 Calculator Uploader (Windows)
 echo ========================================
 echo.
-echo  Copies boot.py and main.py to a M5PaperS3
+echo  Copies boot.py, main.py, scientific.py and telemetry.py to a M5PaperS3
 echo  already running UIFlow2 / MicroPython.
 echo  (No firmware .bin - this is a file upload.)
 echo.
@@ -40,6 +40,8 @@ echo.
 :: Locate the files to upload (next to this script)
 set "BOOT=%~dp0boot.py"
 set "MAIN=%~dp0main.py"
+set "SCI=%~dp0scientific.py"
+set "TELEMETRY=%~dp0telemetry.py"
 if not exist "!BOOT!" (
     echo [ERROR] boot.py not found next to this script.
     pause
@@ -50,7 +52,17 @@ if not exist "!MAIN!" (
     pause
     exit /b 1
 )
-echo [OK] Found: boot.py, main.py
+if not exist "!SCI!" (
+    echo [ERROR] scientific.py not found next to this script.
+    pause
+    exit /b 1
+)
+if not exist "!TELEMETRY!" (
+    echo [ERROR] telemetry.py not found next to this script.
+    pause
+    exit /b 1
+)
+echo [OK] Found: boot.py, main.py, scientific.py, telemetry.py
 echo.
 
 :: Auto-detect COM port
@@ -107,7 +119,7 @@ echo.
 echo [INFO] Uploading to !PORT! ...
 echo        Close UIFlow2 / any serial monitor first, or the port will be busy.
 echo.
-python -m mpremote connect "!PORT!" fs cp "!BOOT!" :boot.py + fs cp "!MAIN!" :main.py
+python -m mpremote connect "!PORT!" fs cp "!BOOT!" :boot.py + fs cp "!MAIN!" :main.py + fs cp "!SCI!" :scientific.py + fs cp "!TELEMETRY!" :telemetry.py
 if errorlevel 1 (
     echo.
     echo [ERROR] Upload failed.
@@ -19,6 +19,8 @@ import M5
 import time
 import math
 import gc
+from array import array
+import telemetry
 
 # ガベージコレクションを実行（メモリ最適化のため）
 gc.collect()
@@ -37,6 +39,98 @@ SCREEN_HEIGHT = 960
 # ボタンのフォントサイズ（描画で共有）
 BUTTON_FONT_SIZE = 5
 
+# 表示エリアのフォントサイズ
+DISPLAY_FONT_SIZE = 4
+
+# フォントごとの1文字あたりの幅と高さ（テキストサイズ1のとき）。
+# None は M5GFX の既定フォント（6x8 の等幅）。textWidth() が使えない環境での代替値。
+FONT_METRICS = {None: (6, 8)}
+
+# テキスト幅キャッシュの上限（LRU）
+TEXT_WIDTH_CACHE_SIZE = 32
+
+# ボタンの文字と枠の最小余白（ラベルが収まらなければ文字サイズを下げる）
+KEY_PADDING = 6
+
+# キーのスタイルクラスと背景色
+KEY_STYLES = {
+    "num": WHITE,  # 数字と小数点は白
+    "op": ORANGE,  # 演算子はオレンジ
+    "fn": GRAY,  # その他のボタンはグレー
+}
+
+# スタイルクラスに属するキー（どれにも属さないキーは "fn"）
+KEY_CLASSES = {
+    "num": ("0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "."),
+    "op": ("+", "-", "*", "/", "="),
+}
+
+# 基本のキー配置（縦画面の標準・関数ページで共通）
+_BASIC_ROWS = (
+    ("7", "8", "9", "/"),
+    ("4", "5", "6", "*"),
+    ("1", "2", "3", "-"),
+    ("0", ".", "=", "+"),
+    ("C", "+/-", "<", "rt"),
+)
+
+# キーパッドのレイアウト定義（起動時に一度だけテーブルへコンパイルする）
+#   rotation: 起動時の向きからの回転量（1 = 90度）
+#   screen:   回転後の画面サイズ (幅, 高さ)
+#   display:  表示エリア (x, y, 幅, 高さ)
+#   origin:   キーパッド左上 (x, y)
+#   width:    キーパッド全体の幅。各行のキーはこの幅を等分する
+#   key_height, gap: キーの高さとキー間の隙間
+#   rows:     キーの行。"" は空きマス
+LAYOUT_SPECS = {
+    "standard": {
+        "rotation": 0,
+        "screen": (SCREEN_WIDTH, SCREEN_HEIGHT),
+        "display": (20, 50, 500, 80),
+        "origin": (15, 160),
+        "width": 470,
+        "key_height": 100,
+        "gap": 10,
+        "rows": _BASIC_ROWS + (("sci", "rot"),),
+    },
+    "scientific": {
+        "rotation": 0,
+        "screen": (SCREEN_WIDTH, SCREEN_HEIGHT),
+        "display": (20, 50, 500, 80),
+        "origin": (15, 160),
+        "width": 470,
+        "key_height": 100,
+        "gap": 10,
+        "rows": _BASIC_ROWS + (("sin", "cos", "tan", "log", "ln"), ("x^y", "n!", "%", "std", "rot")),
+    },
+    "landscape": {
+        "rotation": 1,
+        "screen": (SCREEN_HEIGHT, SCREEN_WIDTH),
+        "display": (20, 50, 920, 80),
+        "origin": (15, 150),
+        "width": 930,
+        "key_height": 80,
+        "gap": 10,
+        "rows": (
+            ("7", "8", "9", "/", "C", "sin", "cos", "tan"),
+            ("4", "5", "6", "*", "+/-", "log", "ln", "x^y"),
+            ("1", "2", "3", "-", "<", "n!", "%", "rt"),
+            ("0", ".", "=", "+", "rot", "", "", ""),
+        ),
+    },
+}
+
+# 起動時のレイアウト
+START_LAYOUT = "standard"
+
+# 診断ログ（telemetry.py）のファイルと、空きヒープ・バッテリーを記録する間隔（ミリ秒）
+TELEMETRY_LOG = "telemetry.bin"
+TELEMETRY_SAMPLE_INTERVAL = 60000
+
+# 一時停止画面で端数のブロックも書き出す最小レコード数。
+# これより少なければパディングだらけのブロックでフラッシュを消耗しないよう RAM に残しておく
+TELEMETRY_PAUSE_FLUSH_MIN = telemetry.RECORDS_PER_BLOCK // 4
+
 # 本機は e-ink（EPD）。バックライトが無いので setBrightness ベースの
 # 調光・スリープは効かず、スリープ描画はフルリフレッシュで逆に電力を使う。よって省電力層は撤去。
 # 真のスリープが必要なら M5.Power.deepSleep() + タッチGPIO wake を別途実装する。
@@ -47,8 +141,15 @@ previous_value = 0  # 前回の計算値
 current_operation = None  # 現在の操作（+, -, *, /）
 clear_on_next_input = True  # 次の入力で表示をクリアするかどうか
 
-# ボタンの情報を格納する辞書
-buttons = {}
+# 関数キー（初めて押されたときに scientific モジュールを読み込む）
+SCIENTIFIC_KEYS = ("sin", "cos", "tan", "log", "ln", "x^y", "n!", "%")
+
+_scientific = None  # 読み込み済みの scientific モジュール
+
+# コンパイル済みレイアウト（名前 -> テーブル）と現在のレイアウト
+LAYOUTS = {}
+layout = None
+boot_rotation = 0  # 起動時の画面の向き
 
 # 一時停止（電源ボタン押下時）
 is_paused = False
@@ -61,15 +162,168 @@ last_touch_y = -1  # 最後にタッチが開始されたY座標
 last_touch_time = 0  # 最後にタッチが処理された時間
 touch_debounce_time = 500  # タッチのデバウンス時間（ミリ秒）
 
+last_telemetry_sample_time = 0  # 空きヒープ・バッテリーを最後に記録した時間
+
+# テキスト計測キャッシュ
+_glyph_widths = {}  # (文字, フォント, サイズ) -> 幅。文字種が少ないので実質有界
+_text_widths = {}  # (文字列, フォント, サイズ) -> 幅
+_font_heights = {}  # (フォント, サイズ) -> 高さ
+_text_width_order = []  # LRU 順（先頭が最古）。MicroPython の dict は順序を保証しないため別に持つ
+
+
+def _measure_glyph(ch, size, font):
+    """1文字の幅を実機の textWidth() で測る。使えなければフォント表から求める"""
+    try:
+        if font is not None:
+            M5.Lcd.setFont(font)
+        M5.Lcd.setTextSize(size)
+        width = M5.Lcd.textWidth(ch)
+        if width > 0:
+            return width
+    except Exception:
+        pass
+    return FONT_METRICS.get(font, FONT_METRICS[None])[0] * size
+
+
+def text_width(text, size, font=None):
+    """文字列の描画幅を返す（LRU キャッシュ付き）
+
+    未計測の文字列は文字ごとの幅（一度だけ実測）を合計して求めるので、
+    キー入力のたびに表示が変わっても textWidth() は新しい文字にしか呼ばれない。
+    """
+    key = (text, font, size)
+    width = _text_widths.get(key)
+    if width is not None:
+        # 最近使ったものを末尾へ
+        if _text_width_order[-1] != key:
+            _text_width_order.remove(key)
+            _text_width_order.append(key)
+        return width
+
+    width = 0
+    for ch in text:
+        glyph_key = (ch, font, size)
+        glyph_width = _glyph_widths.get(glyph_key)
+        if glyph_width is None:
+            glyph_width = _measure_glyph(ch, size, font)
+            _glyph_widths[glyph_key] = glyph_width
+        width += glyph_width
+
+    # 上限を超えたら最も古いものを捨てる
+    if len(_text_width_order) >= TEXT_WIDTH_CACHE_SIZE:
+        del _text_widths[_text_width_order.pop(0)]
+    _text_widths[key] = width
+    _text_width_order.append(key)
+    return width
+
+
+def text_height(size, font=None):
+    """フォントの高さを返す（(フォント, サイズ) ごとに一度だけ fontHeight() で測る）"""
+    key = (font, size)
+    height = _font_heights.get(key)
+    if height is None:
+        height = 0
+        try:
+            if font is not None:
+                M5.Lcd.setFont(font)
+            M5.Lcd.setTextSize(size)
+            height = M5.Lcd.fontHeight()
+        except Exception:
+            pass
+        if not height or height <= 0:
+            height = FONT_METRICS.get(font, FONT_METRICS[None])[1] * size
+        _font_heights[key] = height
+    return height
+
+
+def compile_layout(spec):
+    """レイアウト定義を描画・当たり判定で共有するフラットなテーブルに変換する
+
+    キー i について rects[4i:4i+4] = (x, y, 幅, 高さ)、
+    text[3i:3i+3] = (文字の x, 文字の y, 文字サイズ)、colors[i] = 背景色。
+    """
+    key_class = {}
+    for cls, keys in KEY_CLASSES.items():
+        for key in keys:
+            key_class[key] = cls
+
+    left, top = spec["origin"]
+    key_height = spec["key_height"]
+    gap = spec["gap"]
+
+    labels = []
+    rects = array("h")
+    text = array("h")
+    colors = array("L")
+
+    for row_idx, row in enumerate(spec["rows"]):
+        key_width = (spec["width"] - gap * (len(row) - 1)) // len(row)
+        y = top + row_idx * (key_height + gap)
+
+        for col_idx, label in enumerate(row):
+            if not label:
+                continue  # 空きマス
+            x = left + col_idx * (key_width + gap)
+
+            # ラベルが収まる文字サイズを選ぶ
+            size = BUTTON_FONT_SIZE
+            while size > 1 and text_width(label, size) > key_width - 2 * KEY_PADDING:
+                size -= 1
+
+            labels.append(label)
+            rects.extend((x, y, key_width, key_height))
+            text.extend(
+                (
+                    x + (key_width - text_width(label, size)) // 2,
+                    y + (key_height - text_height(size)) // 2,
+                    size,
+                )
+            )
+            colors.append(KEY_STYLES[key_class.get(label, "fn")])
+
+    return {
+        "rotation": spec["rotation"],
+        "screen": spec["screen"],
+        "display": spec["display"],
+        "labels": labels,
+        "rects": rects,
+        "text": text,
+        "colors": colors,
+    }
+
+
+def compile_layouts():
+    """全レイアウトをコンパイルする（文字幅を実測するので M5.begin() の後に呼ぶ）"""
+    for name, spec in LAYOUT_SPECS.items():
+        LAYOUTS[name] = compile_layout(spec)
+
+
+def hit_test(x, y):
+    """座標にあるキーのラベルを返す（無ければ None）"""
+    rects = layout["rects"]
+    for i in range(len(layout["labels"])):
+        j = i * 4
+        if rects[j] <= x < rects[j] + rects[j + 2] and rects[j + 1] <= y < rects[j + 1] + rects[j + 3]:
+            return layout["labels"][i]
+    return None
+
 
 # 初期設定
 def setup():
     """初期設定を行う関数"""
-    global is_touch_pressed, last_touch_x, last_touch_y, last_touch_time
+    global is_touch_pressed, last_touch_x, last_touch_y, last_touch_time, boot_rotation
 
     # M5Stackの初期化
     M5.begin()
 
+    # 診断ログを開始
+    telemetry.init(TELEMETRY_LOG)
+    sample_status()
+
+    # キーパッドのレイアウトをコンパイル（文字幅の実測を含むので M5.begin() の後）
+    boot_rotation = M5.Lcd.getRotation()
+    compile_layouts()
+
     # タッチ関連の変数をリセット
     is_touch_pressed = False
     last_touch_x = -1
@@ -85,17 +339,8 @@ def setup():
     # 初期化情報を出力
     print("\n===== M5PaperS3 Calculator App Initialization Started =====")
 
-    # 画面を白で初期化
-    M5.Lcd.fillScreen(WHITE)
-
-    # 表示エリアを描画
-    draw_display_area()
-
-    # ボタンを描画
-    draw_buttons()
-
-    # 初期表示
-    update_display()
+    # 起動時のレイアウトで画面全体を描画
+    set_layout(START_LAYOUT)
 
     # タッチバッファを再度クリア
     M5.update()
@@ -116,71 +361,75 @@ def draw_display_area():
         if hasattr(M5, "Power"):
             bat_level = M5.Power.getBatteryLevel()
             bat_text = f"{bat_level}%"
-            M5.Lcd.drawString(f"Batt: {bat_text}", SCREEN_WIDTH - 100, 10)
+            M5.Lcd.drawString(f"Batt: {bat_text}", layout["screen"][0] - 100, 10)
     except:
         pass
 
     # 表示エリア（結果表示部分）- 角を丸くして見栄えを良くする
-    M5.Lcd.fillRoundRect(20, 50, 500, 80, 8, LIGHT_GRAY)
-    M5.Lcd.drawRoundRect(20, 50, 500, 80, 8, BLACK)
+    x, y, w, h = layout["display"]
+    M5.Lcd.fillRoundRect(x, y, w, h, 8, LIGHT_GRAY)
+    M5.Lcd.drawRoundRect(x, y, w, h, 8, BLACK)
+
+
+def draw_key(table, i):
+    """コンパイル済みテーブルの i 番目のキーを描画する"""
+    x, y, w, h = table["rects"][i * 4 : i * 4 + 4]
+    text_x, text_y, size = table["text"][i * 3 : i * 3 + 3]
+    bg_color = table["colors"][i]
+
+    # ボタンを描画（角を少し丸く）
+    M5.Lcd.fillRoundRect(x, y, w, h, 5, bg_color)
+    M5.Lcd.drawRoundRect(x, y, w, h, 5, BLACK)
+
+    # テキストを描画
+    M5.Lcd.setTextColor(BLACK, bg_color)
+    M5.Lcd.setTextSize(size)
+    M5.Lcd.drawString(table["labels"][i], text_x, text_y)
 
 
 def draw_buttons():
     """ボタンを描画する関数"""
-    global buttons
-
-    # ボタンのレイアウト設定
-    button_width = 110  # 少し大きめのボタン
-    button_height = 100
-    button_gap = 10  # 間隔を少し小さく
-    start_x = 15
-    start_y = 160
-
-    # キーパッドのレイアウト
-    keypad = [
-        ["7", "8", "9", "/"],  # ÷ を / に変更
-        ["4", "5", "6", "*"],  # × を * に変更
-        ["1", "2", "3", "-"],
-        ["0", ".", "=", "+"],
-        ["C", "+/-", "<", "rt"],  # ±, ←, √ を変更
-    ]
+    for i in range(len(layout["labels"])):
+        draw_key(layout, i)
 
-    # ボタンを描画
-    for row_idx, row in enumerate(keypad):
-        y = start_y + row_idx * (button_height + button_gap)
-
-        for col_idx, key in enumerate(row):
-            x = start_x + col_idx * (button_width + button_gap)
 
-            # ボタンの色を設定
-            if key in "0123456789.":
-                bg_color = WHITE  # 数字と小数点は白
-            elif key in ["+", "-", "*", "/", "="]:
-                bg_color = ORANGE  # 演算子はオレンジ
-            else:
-                bg_color = GRAY  # その他のボタンはグレー
+def _key_signature(table, i):
+    """キーの見た目を比較するためのタプル"""
+    return (
+        table["labels"][i],
+        tuple(table["rects"][i * 4 : i * 4 + 4]),
+        tuple(table["text"][i * 3 : i * 3 + 3]),
+        table["colors"][i],
+    )
 
-            # ボタンの情報を保存
-            buttons[key] = {"x": x, "y": y, "width": button_width, "height": button_height, "color": bg_color}
 
-            # ボタンを描画（角を少し丸く）
-            M5.Lcd.fillRoundRect(x, y, button_width, button_height, 5, bg_color)
-            M5.Lcd.drawRoundRect(x, y, button_width, button_height, 5, BLACK)
+def set_layout(name):
+    """レイアウトを切り替える（コンパイル済みテーブルを差し替えるだけ）
 
-            # テキストを描画
-            M5.Lcd.setTextColor(BLACK, bg_color)
-            M5.Lcd.setTextSize(BUTTON_FONT_SIZE)
+    向きと表示エリアが同じなら、見た目の変わったキーだけを描き直す（e-ink の書き換えを最小化）。
+    """
+    global layout
 
-            # 文字ごとのおおよその幅と高さを計算（フォントサイズに基づく）
-            char_width = 6 * BUTTON_FONT_SIZE
-            char_height = 8 * BUTTON_FONT_SIZE
-            text_width = len(key) * char_width
+    old = layout
+    layout = LAYOUTS[name]
+    if old is layout:
+        return
 
-            # テキストの位置を中央に調整
-            text_x = x + (button_width - text_width) // 2
-            text_y = y + (button_height - char_height) // 2
+    if old is None or old["rotation"] != layout["rotation"] or old["display"] != layout["display"]:
+        M5.Lcd.setRotation((boot_rotation + layout["rotation"]) % 4)
+        redraw_calculator()
+        return
 
-            M5.Lcd.drawString(key, text_x, text_y)
+    # 部分再描画: 新しいレイアウトに同じ見た目のキーが無いものだけ消して描く
+    old_keys = [_key_signature(old, i) for i in range(len(old["labels"]))]
+    new_keys = [_key_signature(layout, i) for i in range(len(layout["labels"]))]
+    for i, sig in enumerate(old_keys):
+        if sig not in new_keys:
+            x, y, w, h = sig[1]
+            M5.Lcd.fillRect(x, y, w, h, WHITE)
+    for i, sig in enumerate(new_keys):
+        if sig not in old_keys:
+            draw_key(layout, i)
 
 
 def update_display():
@@ -200,8 +449,9 @@ def update_display():
             display_formatted = display_text[:12]  # エラーの場合は単に切り詰め
 
     # 表示エリアをクリア（角丸を保持）
-    M5.Lcd.fillRoundRect(20, 50, 500, 80, 8, LIGHT_GRAY)
-    M5.Lcd.drawRoundRect(20, 50, 500, 80, 8, BLACK)
+    x, y, w, h = layout["display"]
+    M5.Lcd.fillRoundRect(x, y, w, h, 8, LIGHT_GRAY)
+    M5.Lcd.drawRoundRect(x, y, w, h, 8, BLACK)
 
     # エラー時は赤色で表示
     if display_formatted == "Error":
@@ -209,117 +459,244 @@ def update_display():
     else:
         M5.Lcd.setTextColor(BLACK, LIGHT_GRAY)
 
-    # フォントサイズと位置の調整
-    display_font_size = 4  # 大きめのフォント
-    M5.Lcd.setTextSize(display_font_size)
-
-    # 右寄せで表示（数値が増えていく方向）
-    char_width = 6 * display_font_size
-    text_width = len(display_formatted) * char_width
+    # 右寄せで表示（数値が増えていく方向）。幅は計測キャッシュから
+    width = text_width(display_formatted, DISPLAY_FONT_SIZE)
+    M5.Lcd.setTextSize(DISPLAY_FONT_SIZE)
 
     # 右端からマージンを取って表示位置を計算
-    text_x = 500 - text_width - 20
-    if text_x < 30:  # 左端の最小位置
-        text_x = 30
+    text_x = x + w - width - 40
+    if text_x < x + 10:  # 左端の最小位置
+        text_x = x + 10
 
-    M5.Lcd.drawString(display_formatted, text_x, 75)
+    M5.Lcd.drawString(display_formatted, text_x, y + 25)
 
 
-def button_pressed(key):
-    """ボタンが押されたときの処理を行う関数"""
+def _format_number(value):
+    """計算結果を表示用の文字列にする（整数なら末尾の ".0" を省く）"""
+    text = str(value)
+    if text.endswith(".0"):
+        text = text[:-2]
+    return text
+
+
+def _add(a, b):
+    return a + b
+
+
+def _subtract(a, b):
+    return a - b
+
+
+def _multiply(a, b):
+    return a * b
+
+
+def _divide(a, b):
+    return a / b  # 0 除算は ZeroDivisionError
+
+
+def load_scientific():
+    """関数電卓の関数群を読み込んでキーを登録する（最初に関数キーが押されたときだけ）"""
+    global _scientific
+
+    import scientific
+
+    _scientific = scientific
+    for key in scientific.UNARY:
+        key_handlers[key] = _press_function
+    for key in scientific.BINARY:
+        key_handlers[key] = _press_operator
+    key_handlers["%"] = _press_percent
+    binary_operations.update(scientific.BINARY)
+    print("Scientific functions loaded")
+
+
+def _press_scientific(key):
+    """関数キーの初回処理（関数群を読み込み、登録された処理に渡し直す）"""
+    global display_text, clear_on_next_input
+
+    load_scientific()
+    handler = key_handlers[key]
+    if handler is _press_scientific:
+        # SCIENTIFIC_KEYS にあるのに scientific.py が登録しなかったキー（再帰しないよう止める）
+        print(f"Scientific key not registered: '{key}'")
+        display_text = "Error"
+        clear_on_next_input = True
+        return
+    handler(key)
+
+
+def _press_function(key):
+    """1引数関数キー（sin, log, n! など）の処理"""
+    global display_text, clear_on_next_input
+
+    try:
+        display_text = _format_number(_scientific.UNARY[key](float(display_text)))
+    except (ValueError, OverflowError):
+        display_text = "Error"
+    clear_on_next_input = True
+
+
+def _press_percent(key):
+    """パーセントキーの処理（+/- の途中なら左辺の x% として、保留中の演算をそのまま確定する）"""
+    global display_text, clear_on_next_input
+
+    try:
+        base = previous_value if current_operation == "+" or current_operation == "-" else None
+        display_text = _format_number(_scientific.percent(float(display_text), base))
+    except ValueError:
+        display_text = "Error"
+        clear_on_next_input = True
+        return
+
+    if current_operation is None:
+        clear_on_next_input = True
+    else:
+        clear_on_next_input = False
+        _press_operator("=")
+
+
+def _press_operator(key):
+    """演算子キー（+, -, *, /, = と登録された2引数演算）の処理"""
     global display_text, previous_value, current_operation, clear_on_next_input
 
-    # クリア
-    if key == "C":
-        display_text = "0"
-        previous_value = 0
-        current_operation = None
+    try:
+        current_value = float(display_text)
+
+        # 前回の計算があれば実行
+        if current_operation is not None and not clear_on_next_input:
+            result = binary_operations[current_operation](previous_value, current_value)
+
+            # 結果を表示
+            display_text = _format_number(result)
+            previous_value = result
+        else:
+            previous_value = current_value
+
+        # 次の操作を設定
+        if key == "=":
+            current_operation = None
+        else:
+            current_operation = key
+
+        clear_on_next_input = True
+
+    except (ValueError, OverflowError, ZeroDivisionError):
+        display_text = "Error"
         clear_on_next_input = True
 
-    # バックスペース
-    elif key == "<":  # "←" から "<" に変更
-        if len(display_text) > 1:
-            display_text = display_text[:-1]
+
+def _press_clear(key):
+    """クリア"""
+    global display_text, previous_value, current_operation, clear_on_next_input
+
+    display_text = "0"
+    previous_value = 0
+    current_operation = None
+    clear_on_next_input = True
+
+
+def _press_backspace(key):
+    """バックスペース"""
+    global display_text
+
+    if len(display_text) > 1:
+        display_text = display_text[:-1]
+    else:
+        display_text = "0"
+
+
+def _press_negate(key):
+    """符号反転"""
+    global display_text
+
+    if display_text != "0":
+        if display_text[0] == "-":
+            display_text = display_text[1:]
         else:
-            display_text = "0"
+            display_text = "-" + display_text
 
-    # 符号反転
-    elif key == "+/-":  # "±" から "+/-" に変更
-        if display_text != "0":
-            if display_text[0] == "-":
-                display_text = display_text[1:]
-            else:
-                display_text = "-" + display_text
 
-    # 平方根
-    elif key == "rt":  # "√" から "rt" に変更
-        try:
-            value = float(display_text)
-            if value >= 0:
-                result = math.sqrt(value)
-                display_text = str(result)
-                if display_text.endswith(".0"):
-                    display_text = display_text[:-2]
-            else:
-                display_text = "Error"
-            clear_on_next_input = True
-        except ValueError:
-            display_text = "Error"
-            clear_on_next_input = True
-
-    # 数字と小数点
-    elif key in "0123456789.":
-        if clear_on_next_input or (display_text == "0" and key != "."):
-            # 小数点始まりは "0." にする（float(".") の例外を防ぐ）
-            display_text = "0." if key == "." else key
-            clear_on_next_input = False
+def _press_sqrt(key):
+    """平方根"""
+    global display_text, clear_on_next_input
+
+    try:
+        value = float(display_text)
+        if value >= 0:
+            display_text = _format_number(math.sqrt(value))
         else:
-            # 小数点は1つまで
-            if key == "." and "." in display_text:
-                pass
-            else:
-                display_text += key
+            display_text = "Error"
+    except ValueError:
+        display_text = "Error"
+    clear_on_next_input = True
 
-    # 演算子
-    elif key in ["+", "-", "*", "/", "="]:  # "×", "÷" から "*", "/" に変更
-        try:
-            current_value = float(display_text)
-
-            # 前回の計算があれば実行
-            if current_operation is not None and not clear_on_next_input:
-                if current_operation == "+":
-                    result = previous_value + current_value
-                elif current_operation == "-":
-                    result = previous_value - current_value
-                elif current_operation == "*":  # "×" から "*" に変更
-                    result = previous_value * current_value
-                elif current_operation == "/":  # "÷" から "/" に変更
-                    if current_value == 0:
-                        display_text = "Error"
-                        clear_on_next_input = True
-                        update_display()
-                        return
-                    result = previous_value / current_value
-
-                # 結果を表示
-                display_text = str(result)
-                if display_text.endswith(".0"):
-                    display_text = display_text[:-2]
-                previous_value = result
-            else:
-                previous_value = current_value
 
-            # 次の操作を設定
-            if key == "=":
-                current_operation = None
-            else:
-                current_operation = key
+def _press_digit(key):
+    """数字と小数点"""
+    global display_text, clear_on_next_input
 
-            clear_on_next_input = True
+    if clear_on_next_input or (display_text == "0" and key != "."):
+        # 小数点始まりは "0." にする（float(".") の例外を防ぐ）
+        display_text = "0." if key == "." else key
+        clear_on_next_input = False
+    elif key != "." or "." not in display_text:  # 小数点は1つまで
+        display_text += key
+
+
+def _press_scientific_page(key):
+    """関数ページへ切り替え"""
+    set_layout("scientific")
+
+
+def _press_standard_page(key):
+    """標準ページへ切り替え"""
+    set_layout("standard")
 
-        except ValueError:
-            display_text = "Error"
-            clear_on_next_input = True
+
+def _press_rotate(key):
+    """縦画面と横画面の切り替え（横画面から戻るときは標準ページ）"""
+    if layout is LAYOUTS["landscape"]:
+        set_layout("standard")
+    else:
+        set_layout("landscape")
+
+
+# キー -> 処理関数の対応表（import 時に一度だけ作る）。
+# キーを増やすときはここ（または key_handlers への登録）に追加する。
+key_handlers = {
+    "C": _press_clear,
+    "<": _press_backspace,  # "←" から "<" に変更
+    "+/-": _press_negate,  # "±" から "+/-" に変更
+    "rt": _press_sqrt,  # "√" から "rt" に変更
+    "sci": _press_scientific_page,
+    "std": _press_standard_page,
+    "rot": _press_rotate,
+    "+": _press_operator,
+    "-": _press_operator,
+    "*": _press_operator,  # "×" から "*" に変更
+    "/": _press_operator,  # "÷" から "/" に変更
+    "=": _press_operator,
+}
+for _key in "0123456789.":
+    key_handlers[_key] = _press_digit
+for _key in SCIENTIFIC_KEYS:
+    key_handlers[_key] = _press_scientific  # 初回押下で本来の処理に置き換わる
+
+# 演算子 -> 2引数演算の対応表
+binary_operations = {
+    "+": _add,
+    "-": _subtract,
+    "*": _multiply,
+    "/": _divide,
+}
+
+
+def button_pressed(key):
+    """ボタンが押されたときの処理を行う関数"""
+    handler = key_handlers.get(key)
+    if handler is not None:
+        handler(key)
 
     # 表示を更新
     update_display()
@@ -360,7 +737,7 @@ def check_touch():
         empty_touch_buffer()
 
         # 座標が有効範囲内かチェック
-        if x < 0 or y < 0 or x >= SCREEN_WIDTH or y >= SCREEN_HEIGHT:
+        if x < 0 or y < 0 or x >= layout["screen"][0] or y >= layout["screen"][1]:
             return
 
         if not is_touch_pressed:
@@ -378,16 +755,14 @@ def check_touch():
             # 有効な座標かチェック
             if last_touch_x >= 0 and last_touch_y >= 0:
                 # ボタン検索
-                for key, btn in buttons.items():
-                    btn_x, btn_y = btn["x"], btn["y"]
-                    btn_w, btn_h = btn["width"], btn["height"]
-
-                    if btn_x <= last_touch_x < btn_x + btn_w and btn_y <= last_touch_y < btn_y + btn_h:
-                        print(f"Executing action for button '{key}'")
-                        button_pressed(key)
-                        # ボタンが見つかった場合は次のタッチまでの時間を長めにとる
-                        last_touch_time = current_time
-                        break
+                key = hit_test(last_touch_x, last_touch_y)
+                if key is not None:
+                    print(f"Executing action for button '{key}'")
+                    start_time = time.ticks_ms()
+                    button_pressed(key)
+                    telemetry.record_key(key, time.ticks_diff(time.ticks_ms(), start_time))
+                    # ボタンが見つかった場合は次のタッチまでの時間を長めにとる
+                    last_touch_time = current_time
 
             # 座標をリセット
             last_touch_x = -1
@@ -466,24 +841,31 @@ def show_shutdown_screen():
     M5.Lcd.fillScreen(WHITE)
 
     # 一時停止メッセージを表示
+    width, height = layout["screen"]
     M5.Lcd.setTextColor(BLACK, WHITE)
     M5.Lcd.setTextSize(3)
-    M5.Lcd.drawString("Calculator Paused", SCREEN_WIDTH // 4, SCREEN_HEIGHT // 3)
+    M5.Lcd.drawString("Calculator Paused", width // 4, height // 3)
     M5.Lcd.setTextSize(2)
-    M5.Lcd.drawString("Application still running", SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2)
-    M5.Lcd.drawString("Touch screen to return", SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2 + 40)
-    M5.Lcd.drawString("Or long-press power button", SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2 + 70)
-    M5.Lcd.drawString("to turn off the device", SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2 + 100)
+    M5.Lcd.drawString("Application still running", width // 4, height // 2)
+    M5.Lcd.drawString("Touch screen to return", width // 4, height // 2 + 40)
+    M5.Lcd.drawString("Or long-press power button", width // 4, height // 2 + 70)
+    M5.Lcd.drawString("to turn off the device", width // 4, height // 2 + 100)
 
     # バッテリー情報を表示（利用可能な場合）
     try:
         if hasattr(M5, "Power"):
             bat_level = M5.Power.getBatteryLevel()
             bat_text = f"Battery: {bat_level}%"
-            M5.Lcd.drawString(bat_text, SCREEN_WIDTH // 4, SCREEN_HEIGHT // 2 + 140)
+            M5.Lcd.drawString(bat_text, width // 4, height // 2 + 140)
     except:
         pass
 
+    # そのまま電源を切られてもよいよう、ある程度貯まっていれば診断ログを書き出す
+    # （判定は sample_status() で積む前の件数で行う）
+    force = telemetry.pending() >= TELEMETRY_PAUSE_FLUSH_MIN
+    sample_status()
+    flush_telemetry(force)
+
     # メモリをクリーンアップ
     gc.collect()
 
@@ -493,6 +875,27 @@ def show_shutdown_screen():
     # 制御をメインループに戻す
 
 
+def sample_status():
+    """空きヒープとバッテリー残量を診断ログに記録する関数"""
+    global last_telemetry_sample_time
+
+    last_telemetry_sample_time = time.ticks_ms()
+    telemetry.record(telemetry.HEAP, 0, gc.mem_free() // 1024)
+    try:
+        if hasattr(M5, "Power"):
+            telemetry.record(telemetry.BATTERY, 0, M5.Power.getBatteryLevel())
+    except:
+        pass
+
+
+def flush_telemetry(force=False):
+    """診断ログをフラッシュへ書き出す関数（force=False なら満杯のブロックだけ）"""
+    try:
+        telemetry.flush(force)
+    except Exception as e:
+        print(f"Telemetry flush error: {e}")
+
+
 # メインループ
 def loop():
     """メインループ関数"""
@@ -503,11 +906,20 @@ def loop():
         # タッチ入力をチェック
         check_touch()
 
+        # 空きヒープとバッテリーを定期的に記録
+        if time.ticks_diff(time.ticks_ms(), last_telemetry_sample_time) >= TELEMETRY_SAMPLE_INTERVAL:
+            sample_status()
+
+        # タッチしていない間に、満杯になったログのブロックを書き出す
+        if not is_touch_pressed:
+            flush_telemetry()
+
         # 少し長めの遅延を入れることでタッチ検出を安定させる
         time.sleep_ms(100)
 
     except Exception as e:
         print(f"Error occurred: {e}")
+        telemetry.record_error(e)
         time.sleep_ms(100)
         # エラー回復を試みる
         gc.collect()
@@ -579,6 +991,7 @@ if __name__ == "__main__":
 
                 sys.print_exception(e)
                 print(f"Loop error {error_count}: {type(e).__name__} - {str(e)}")
+                telemetry.record_error(e, error_count)
 
                 # 短時間の回復待機
                 time.sleep_ms(500)
@@ -598,6 +1011,10 @@ if __name__ == "__main__":
                     total = gc.mem_alloc() + free
                     M5.Lcd.drawString(f"Memory: {free/1024:.1f}KB free / {total/1024:.1f}KB total", 10, 160)
 
+                    # 再起動で消える前に診断ログを書き出す
+                    sample_status()
+                    flush_telemetry(force=True)
+
                     time.sleep(3)
                     break  # メインループを終了して再起動
 
@@ -606,6 +1023,10 @@ if __name__ == "__main__":
 
         sys.print_exception(e)
 
+        # 診断ログを書き出す
+        telemetry.record_error(e)
+        flush_telemetry(force=True)
+
         # エラーメッセージを表示
         M5.Lcd.fillScreen(WHITE)
         M5.Lcd.setTextColor(0xFF0000, WHITE)  # 赤色
@@ -0,0 +1,147 @@
+# SPDX-FileCopyrightText: 2025 M5Stack Technology CO LTD
+#
+# SPDX-License-Identifier: Apache-2.0
+
+# 関数電卓の関数群
+# 起動時には読み込まず、最初に関数キーが押されたときに main.py から import される。
+# 角度は度（DEG）で扱う。定義域外は ValueError、桁あふれは OverflowError を送出する。
+import math
+
+# 階乗の上限（これを超えると float に収まらない）
+FACTORIAL_MAX = 170
+
+# 計算結果キャッシュの上限（階乗・べき乗）
+CACHE_SIZE = 16
+
+_INF = float("inf")
+
+# 計算結果キャッシュ
+_cache = {}
+_cache_order = []  # 古い順。MicroPython の dict は順序を保証しないため別に持つ
+
+
+def _cached(key):
+    """キャッシュから結果を取り出す（無ければ None）"""
+    value = _cache.get(key)
+    if value is not None and _cache_order[-1] != key:
+        # 最近使ったものを末尾へ
+        _cache_order.remove(key)
+        _cache_order.append(key)
+    return value
+
+
+def _store(key, value):
+    """結果をキャッシュする（上限を超えたら最も古いものを捨てる）"""
+    if len(_cache_order) >= CACHE_SIZE:
+        del _cache[_cache_order.pop(0)]
+    _cache[key] = value
+    _cache_order.append(key)
+    return value
+
+
+def _finite(value):
+    """inf / nan を例外に変換する（MicroPython は例外を出さずに inf / nan を返すことがある）"""
+    if value != value:
+        raise ValueError("math domain error")
+    if value == _INF or value == -_INF:
+        raise OverflowError("math range error")
+    return value
+
+
+# sin の値が正確に表せる角度（度、0〜360）。math.sin では sin(30) が 0.49999999999999994、
+# sin(180) が 1.2e-16 になるので、この角度だけは表の値を返す。
+_SIN_EXACT = {0: 0.0, 30: 0.5, 90: 1.0, 150: 0.5, 180: 0.0, 210: -0.5, 270: -1.0, 330: -0.5}
+
+# tan の値が正確に表せる角度（度、0〜360）。90度 + 180度 * n は表に無く、tan() で弾く
+_TAN_EXACT = {0: 0.0, 45: 1.0, 135: -1.0, 180: 0.0, 225: 1.0, 315: -1.0}
+
+
+def sin(x):
+    """正弦（度）"""
+    value = _SIN_EXACT.get(x % 360)
+    if value is None:
+        value = math.sin(math.radians(x))
+    return value
+
+
+def cos(x):
+    """余弦（度）"""
+    value = _SIN_EXACT.get((x + 90) % 360)
+    if value is None:
+        value = math.cos(math.radians(x))
+    return value
+
+
+def tan(x):
+    """正接（度）"""
+    # 90度 + 180度 * n では定義されない
+    if x % 180 == 90:
+        raise ValueError("math domain error")
+    value = _TAN_EXACT.get(x % 360)
+    if value is None:
+        value = math.tan(math.radians(x))
+    return value
+
+
+def log(x):
+    """常用対数"""
+    if x <= 0:
+        raise ValueError("math domain error")
+    return math.log10(x)
+
+
+def ln(x):
+    """自然対数"""
+    if x <= 0:
+        raise ValueError("math domain error")
+    return math.log(x)
+
+
+def factorial(x):
+    """階乗（0 以上の整数のみ）"""
+    if x < 0 or x != int(x):
+        raise ValueError("math domain error")
+    if x > FACTORIAL_MAX:
+        raise OverflowError("math range error")
+
+    n = int(x)
+    key = ("n!", n)
+    value = _cached(key)
+    if value is None:
+        result = 1
+        for i in range(2, n + 1):
+            result *= i
+        value = _store(key, float(result))
+    return value
+
+
+def power(x, y):
+    """べき乗 x^y"""
+    key = ("x^y", x, y)
+    value = _cached(key)
+    if value is None:
+        value = _store(key, _finite(math.pow(x, y)))
+    return value
+
+
+def percent(x, base=None):
+    """パーセント。base（+/- の左辺）があれば base の x%、無ければ x / 100"""
+    if base is None:
+        return x / 100
+    return base * x / 100
+
+
+# キーと1引数関数の対応
+UNARY = {
+    "sin": sin,
+    "cos": cos,
+    "tan": tan,
+    "log": log,
+    "ln": ln,
+    "n!": factorial,
+}
+
+# キーと2引数演算の対応（+ などと同じく = で確定する）
+BINARY = {
+    "x^y": power,
+}
@@ -0,0 +1,164 @@
+# SPDX-FileCopyrightText: 2025 M5Stack Technology CO LTD
+#
+# SPDX-License-Identifier: Apache-2.0
+
+# 現場診断用のバイナリイベントログ
+# 固定長レコードを RAM のリングバッファに貯め、フラッシュにはブロック単位（4KB）でまとめて書く。
+# フラッシュの書き込み回数と消耗を抑えるため、書くのは「アイドル時に満杯のブロックだけ」か
+# 「再起動・致命的エラーの直前（端数はパディングしてブロックに揃える）」のどちらか。
+# 書式はデスクトップ側の decode_log.py と共有する（M5 には依存しない）。
+import os
+import struct
+import time
+
+# レコード: 時刻(ms, uint32) / イベント種別(uint8) / コード(uint8) / 値(uint16)
+# 時刻は time.ticks_ms() そのまま。MicroPython では 2**30 ms（約12日）で 0 に戻るので、
+# 並び順と間隔の目安にだけ使う（decode_log.py は時刻を集計に使わない）。
+RECORD = "<IBBH"
+RECORD_SIZE = 8
+BLOCK_SIZE = 4096  # フラッシュの消去ブロックに合わせる
+RECORDS_PER_BLOCK = BLOCK_SIZE // RECORD_SIZE
+BUFFER_BLOCKS = 2  # RAM バッファ（1ブロック書き出し中も記録を続けられるよう2ブロック）
+MAX_FILE_BLOCKS = 32  # これを超えたら .old に回して新しいファイルにする
+FORMAT_VERSION = 1
+
+# イベント種別
+PAD = 0  # ブロックを揃えるための詰め物（デコード時は読み飛ばす）
+BOOT = 1  # 起動（値 = FORMAT_VERSION）
+KEY = 2  # キー押下（コード = KEYS の番号）
+LATENCY = 3  # キー処理時間（コード = KEYS の番号、値 = ms）
+ERROR = 4  # 例外（コード = ERROR_TYPES の番号、値 = 連続エラー回数）
+HEAP = 5  # 空きヒープ（値 = KB）
+BATTERY = 6  # バッテリー残量（値 = %）
+DROPPED = 7  # バッファが溢れて捨てたレコード（値 = 件数）
+EVENT_NAMES = ("pad", "boot", "key", "latency", "error", "heap", "battery", "dropped")
+
+# キーのコード（並びはログの互換性のため末尾に追加するだけにする）
+KEYS = (
+    "0", "1", "2", "3", "4", "5", "6", "7", "8", "9", ".",
+    "+", "-", "*", "/", "=", "C", "+/-", "<", "rt", "sci", "std",
+    "sin", "cos", "tan", "log", "ln", "x^y", "n!", "%", "rot",
+)  # fmt: skip
+KEY_CODES = {key: code for code, key in enumerate(KEYS)}
+UNKNOWN = 255
+
+# 例外のコード（並びは末尾に追加するだけにする。0 はその他）
+ERROR_TYPES = (
+    "Exception",
+    "OSError",
+    "MemoryError",
+    "ValueError",
+    "TypeError",
+    "KeyError",
+    "IndexError",
+    "AttributeError",
+    "ZeroDivisionError",
+    "OverflowError",
+    "RuntimeError",
+    "NameError",
+)
+ERROR_CODES = {name: code for code, name in enumerate(ERROR_TYPES)}
+
+_ticks_ms = getattr(time, "ticks_ms", None) or (lambda: int(time.time() * 1000) % (1 << 30))
+
+# リングバッファ
+_buffer = bytearray(BUFFER_BLOCKS * BLOCK_SIZE)
+_start = 0  # 最古のレコードの位置（バイト）。常にブロック境界
+_count = 0  # バッファ内のレコード数
+dropped = 0  # 書き出す前に溢れて捨てたレコード数
+_path = None  # ログファイル（None なら記録だけしてフラッシュしない）
+
+
+def init(path):
+    """ログを開始する（バッファを空にして起動レコードを積む）"""
+    global _path, _start, _count, dropped
+
+    _path = path
+    _start = 0
+    _count = 0
+    dropped = 0
+    record(BOOT, 0, FORMAT_VERSION)
+
+
+def pending():
+    """未書き出しのレコード数"""
+    return _count
+
+
+def record(event, code=0, value=0):
+    """レコードを1件バッファに積む（メモリ確保なし）"""
+    global _start, _count, dropped
+
+    if _count == BUFFER_BLOCKS * RECORDS_PER_BLOCK:
+        # 満杯なら最も古いブロックを捨てる（ブロック境界を保つため1件ずつではなくブロック単位）。
+        # 捨てた件数はログにも残す（空いたブロックに入るので溢れ直すことはない）
+        _start = (_start + BLOCK_SIZE) % len(_buffer)
+        _count -= RECORDS_PER_BLOCK
+        dropped += RECORDS_PER_BLOCK
+        offset = (_start + _count * RECORD_SIZE) % len(_buffer)
+        struct.pack_into(RECORD, _buffer, offset, _ticks_ms(), DROPPED, 0, RECORDS_PER_BLOCK)
+        _count += 1
+
+    offset = (_start + _count * RECORD_SIZE) % len(_buffer)
+    struct.pack_into(RECORD, _buffer, offset, _ticks_ms(), event, code, min(max(value, 0), 0xFFFF))
+    _count += 1
+
+
+def record_key(key, latency_ms):
+    """キー押下とその処理時間を記録する"""
+    code = KEY_CODES.get(key, UNKNOWN)
+    record(KEY, code)
+    record(LATENCY, code, latency_ms)
+
+
+def record_error(e, count=1):
+    """例外の種類を記録する"""
+    record(ERROR, ERROR_CODES.get(type(e).__name__, 0), count)
+
+
+def flush(force=False):
+    """満杯のブロックをファイルへ追記し、書いたブロック数を返す
+
+    force=True なら端数も PAD で1ブロックに揃えて書く（再起動・致命的エラーの直前用）。
+    """
+    global _start, _count
+
+    if _path is None:
+        return 0
+
+    remainder = _count % RECORDS_PER_BLOCK
+    if force and remainder:
+        # 端数をパディングしてブロックを埋める
+        end = (_start + _count * RECORD_SIZE) % len(_buffer)
+        pad = (RECORDS_PER_BLOCK - remainder) * RECORD_SIZE
+        for i in range(end, end + pad):
+            _buffer[i] = PAD
+        _count += pad // RECORD_SIZE
+
+    blocks = _count // RECORDS_PER_BLOCK
+    if blocks == 0:
+        return 0
+
+    _rotate(blocks * BLOCK_SIZE)
+    view = memoryview(_buffer)
+    with open(_path, "ab") as f:
+        for _ in range(blocks):
+            f.write(view[_start : _start + BLOCK_SIZE])
+            _start = (_start + BLOCK_SIZE) % len(_buffer)
+            _count -= RECORDS_PER_BLOCK
+    return blocks
+
+
+def _rotate(size):
+    """追記でファイルが上限を超えるなら、今のファイルを .old に回す"""
+    try:
+        current = os.stat(_path)[6]
+    except OSError:
+        return  # まだファイルが無い
+    if current + size <= MAX_FILE_BLOCKS * BLOCK_SIZE:
+        return
+    try:
+        os.remove(_path + ".old")
+    except OSError:
+        pass
+    os.rename(_path, _path + ".old")
@@ -1,6 +1,10 @@
 # 電卓ロジックのセルフチェック（実機不要）。fake M5 を挿して本物の button_pressed を叩く。
 # 実行: python test_calc.py
+import math
+import os
 import sys
+import tempfile
+import tracemalloc
 
 
 class _Any:
@@ -17,6 +21,9 @@ sys.modules["M5"] = _Any()
 
 import main  # noqa: E402
 
+main.compile_layouts()
+main.set_layout("standard")
+
 
 def press(seq):
     main.display_text = "0"
@@ -42,4 +49,174 @@ assert press(["5", "+/-"]) == "-5"
 assert press(["1", "2", "<"]) == "1"
 assert press(["1", "2", "C"]) == "0"
 
+# テキスト計測キャッシュ（fake M5 の textWidth() は 0 を返すので等幅表にフォールバック）
+assert main.text_width("+/-", 5) == 3 * 6 * 5
+assert main.text_height(5) == 8 * 5
+main.text_width("rt", 5)
+assert main._text_width_order[-1] == ("rt", None, 5)
+main.text_width("+/-", 5)  # ヒットしたものは最新扱い
+assert main._text_width_order[-1] == ("+/-", None, 5)
+for i in range(main.TEXT_WIDTH_CACHE_SIZE * 2):
+    main.text_width(str(i), 4)
+assert len(main._text_widths) == len(main._text_width_order) == main.TEXT_WIDTH_CACHE_SIZE
+assert ("rt", None, 5) not in main._text_widths  # 古いものから追い出される
+
+# キーパッドのレイアウト（コンパイル済みテーブル）
+std = main.LAYOUTS["standard"]
+i = std["labels"].index("7")
+assert tuple(std["rects"][i * 4 : i * 4 + 4]) == (15, 160, 110, 100)  # 旧ハードコードと同じ位置
+i = std["labels"].index("rt")
+assert tuple(std["rects"][i * 4 : i * 4 + 4]) == (375, 600, 110, 100)
+assert std["colors"][std["labels"].index("5")] == main.WHITE
+assert std["colors"][std["labels"].index("=")] == main.ORANGE
+assert std["colors"][std["labels"].index("C")] == main.GRAY
+assert main.hit_test(15, 160) == "7"
+assert main.hit_test(130, 160) is None  # キー間の隙間
+assert main.hit_test(400, 500) == "+"
+assert main.hit_test(20, 20) is None  # 表示エリア
+# ページ切り替えはテーブルの差し替えだけ
+press(["sci"])
+assert main.layout is main.LAYOUTS["scientific"]
+assert main.hit_test(20, 720) == "sin"
+press(["std"])
+assert main.layout is std
+assert "sin" not in std["labels"] and "" not in main.LAYOUTS["landscape"]["labels"]
+# 横画面への切り替えも回転済みのテーブルを差し替えるだけ
+press(["rot"])
+assert main.layout is main.LAYOUTS["landscape"]
+assert main.hit_test(900, 200) == "tan" and main.hit_test(500, 450) == "rot"
+assert main.hit_test(20, 720) is None  # 縦画面の下段は横画面の外
+press(["sci", "rot"])
+assert main.layout is main.LAYOUTS["landscape"]
+press(["rot"])
+assert main.layout is std and main.hit_test(400, 500) == "+"
+# 狭いキーは文字サイズを下げて枠内に収める
+sci = main.LAYOUTS["scientific"]
+for i in range(len(sci["labels"])):
+    x, _, w, _ = sci["rects"][i * 4 : i * 4 + 4]
+    text_x, _, size = sci["text"][i * 3 : i * 3 + 3]
+    assert x <= text_x and text_x + main.text_width(sci["labels"][i], size) <= x + w, sci["labels"][i]
+
+# 関数電卓（scientific は最初の関数キーまで読み込まれない）
+assert "scientific" not in sys.modules and main._scientific is None
+assert press(["3", "0", "sin"]) == "0.5"
+assert "scientific" in sys.modules
+sci = sys.modules["scientific"]
+# 正確な値が決まる角度は表の値、それ以外は math の結果そのもの（丸めない）
+for x, sin_x, cos_x in ((0, 0, 1), (30, 0.5, None), (90, 1, 0), (180, 0, -1), (-90, -1, 0), (390, 0.5, None), (60, None, 0.5)):
+    assert (sin_x is None or sci.sin(x) == sin_x) and (cos_x is None or sci.cos(x) == cos_x), x
+    assert abs(sci.sin(x) - math.sin(math.radians(x))) < 1e-15, x
+for x, tan_x in ((0, 0), (45, 1), (135, -1), (-45, -1), (180, 0)):
+    assert sci.tan(x) == tan_x, x
+for x in (1e-9, 1e-6, 1e-4, 0.001, 12.5, 75, -37.25, 123456.789):
+    r = math.radians(x)
+    assert sci.sin(x) == math.sin(r) and sci.cos(x) == math.cos(r) and sci.tan(x) == math.tan(r), x
+for x in (90, 270, -90, 450):
+    try:
+        sci.tan(x)
+        assert False, x
+    except ValueError:
+        pass
+for x in (1e-5, 0.5, 1, 2, 10, 12345.678):
+    assert sci.log(x) == math.log10(x) and sci.ln(x) == math.log(x)
+for n in range(0, 171, 7):
+    assert sci.factorial(n) == float(math.factorial(n))
+for x, y in ((2, 10), (2, 0.5), (10, -3), (1.5, 2.5), (0, 0)):
+    assert sci.power(x, y) == math.pow(x, y)
+assert sci.power(2, 10) is sci.power(2, 10)  # キャッシュから返る
+for i in range(sci.CACHE_SIZE * 2):
+    sci.power(3, i)
+assert len(sci._cache) == len(sci._cache_order) == sci.CACHE_SIZE
+assert press(["9", "0", "cos"]) == "0" and press(["1", "8", "0", "sin"]) == "0"
+assert press(["9", "0", "tan"]) == "Error"
+assert press(["1", "0", "0", "log"]) == "2"
+assert press(["0", "ln"]) == "Error"
+assert press(["5", "n!"]) == "120"
+assert press(["2", ".", "5", "n!"]) == "Error"
+assert press(["1", "7", "1", "n!"]) == "Error"
+assert press(["2", "x^y", "1", "0", "="]) == "1024"
+assert press(["2", "x^y", "3", "+", "1", "="]) == "9"
+assert press(["1", "0", "x^y", "4", "0", "0", "="]) == "Error"
+assert press(["5", "0", "%"]) == "0.5"
+assert press(["2", "0", "0", "+", "1", "0", "%"]) == "220"
+assert press(["2", "0", "0", "-", "1", "0", "%"]) == "180"
+assert press(["2", "0", "0", "*", "1", "0", "%"]) == "20"
+
+# キー処理は対応表で振り分ける（拡張は登録するだけ）
+assert main.key_handlers["sin"] is main._press_function  # 読み込み後は本来の処理に置き換わっている
+assert set(main.SCIENTIFIC_KEYS) == set(sci.UNARY) | set(sci.BINARY) | {"%"}  # 登録漏れが無い
+main.key_handlers["hyp"] = main._press_scientific  # scientific.py が登録しないキーでも再帰しない
+assert press(["1", "hyp"]) == "Error"
+del main.key_handlers["hyp"]
+assert press(["1", "?", "2"]) == "12"  # 未登録のキーは無視
+main.key_handlers["00"] = lambda key: main._press_digit("0") or main._press_digit("0")
+assert press(["1", "00"]) == "100"
+del main.key_handlers["00"]
+
+
+# 振り分け経路はメモリを確保しない（空ループと同じ使用量）
+def _traced(func):
+    func()
+    tracemalloc.start()
+    for _ in range(1000):
+        func()
+    usage = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return usage
+
+
+assert _traced(lambda: main.key_handlers.get("C")("C")) == _traced(lambda: None)
+
+# 診断ログ（一時ディレクトリをフラッシュの代わりにする）
+import decode_log  # noqa: E402
+import telemetry  # noqa: E402
+
+with tempfile.TemporaryDirectory() as flash:
+    log = os.path.join(flash, "telemetry.bin")
+    telemetry.init(log)
+    for _ in range(100):
+        telemetry.record_key("5", 30)
+    telemetry.record_key("sin", 250)
+    telemetry.record_key("??", 0)
+    assert telemetry.flush() == 0 and not os.path.exists(log)  # ブロックが埋まるまでは書かない
+    telemetry.record_error(ZeroDivisionError(), 3)
+    telemetry.record(telemetry.HEAP, 0, 180)
+    telemetry.record(telemetry.BATTERY, 0, 87)
+    telemetry.record(telemetry.BATTERY, 0, 85)
+    for _ in range(telemetry.RECORDS_PER_BLOCK):
+        telemetry.record(telemetry.HEAP, 0, 175)
+    assert telemetry.flush() == 1  # 満杯の1ブロックだけ書く
+    assert os.path.getsize(log) == telemetry.BLOCK_SIZE
+    assert telemetry.flush(force=True) == 1  # 端数はパディングしてブロックに揃える
+    assert os.path.getsize(log) == 2 * telemetry.BLOCK_SIZE and telemetry.pending() == 0
+
+    with open(log, "rb") as stream:
+        stats = decode_log.summarize(decode_log.read_records(stream))
+    assert stats["records"] == 1 + 2 * 102 + 3 + telemetry.RECORDS_PER_BLOCK + 1
+    assert stats["boots"] == 1
+    assert stats["keys"] == {"5": 100, "sin": 1, "?": 1}
+    assert stats["latency"]["count"] == 102 and stats["latency"]["max"] == 250
+    assert stats["errors"] == {"ZeroDivisionError": 1}
+    assert stats["heap_kb"] == {"min": 175, "last": 175}
+    assert stats["battery"] == {"first": 87, "last": 85, "min": 85}
+
+    # 書き出せないまま溢れたら古いブロックから捨てる
+    os.remove(log)
+    telemetry.init(log)
+    for i in range(telemetry.BUFFER_BLOCKS * telemetry.RECORDS_PER_BLOCK):  # 起動レコードと合わせて1件溢れる
+        telemetry.record(telemetry.HEAP, 0, i)
+    assert telemetry.dropped == telemetry.RECORDS_PER_BLOCK
+    assert telemetry.pending() == (telemetry.BUFFER_BLOCKS - 1) * telemetry.RECORDS_PER_BLOCK + 2  # 溢れの記録も積む
+
+    # 上限を超えるファイルは .old に回す
+    with open(log, "ab") as f:
+        f.write(bytes((telemetry.MAX_FILE_BLOCKS - 1) * telemetry.BLOCK_SIZE))
+    assert telemetry.flush(force=True) == telemetry.BUFFER_BLOCKS
+    assert os.path.getsize(log + ".old") == (telemetry.MAX_FILE_BLOCKS - 1) * telemetry.BLOCK_SIZE
+    assert os.path.getsize(log) == telemetry.BUFFER_BLOCKS * telemetry.BLOCK_SIZE
+    with open(log, "rb") as stream:
+        stats = decode_log.summarize(decode_log.read_records(stream))
+    assert stats["heap_kb"]["last"] == telemetry.BUFFER_BLOCKS * telemetry.RECORDS_PER_BLOCK - 1
+    assert stats["dropped"] == telemetry.RECORDS_PER_BLOCK
+
 print("OK: all calculator self-checks passed")